@@ -1,12 +1,32 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
+import mmap
 import os
 import re
+import shlex
 import shutil
 import subprocess
 import sys
 from datetime import datetime
-from typing import Iterable, List, Optional, Sequence, Tuple
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+from pdfsummary.common import (
+    MAX_CHARS_PER_TOKEN,
+    cache_read,
+    cache_write,
+    count_fixed_tokens,
+    count_tokens,
+    default_cache_dir,
+    fit_prefix_to_tokens,
+    group_for_merge,
+    render_within_budget,
+)
 
 
 def parse_page_ranges(pages: Optional[str]) -> Optional[Sequence[int]]:
@@ -39,12 +59,19 @@ def parse_page_ranges(pages: Optional[str]) -> Optional[Sequence[int]]:
     return sorted(set(result))
 
 
-def read_pdf_text(input_path: str, target_pages: Optional[Sequence[int]] = None) -> str:
-    """pdfminer.sixを利用してテキスト抽出。
+def iter_pdf_pages(
+    source: Union[str, BinaryIO], target_pages: Optional[Sequence[int]] = None
+) -> Iterator[str]:
+    """pdfminer.sixでページ単位にテキストを抽出して順に返す。
+    文書全体を一つの文字列に載せないため、長いPDFでもピークメモリを抑えられる。
+    source はファイルパスまたはシーク可能なバイナリファイル（mmap等）。
     target_pages は1始まりのページ番号配列。
     """
     try:
-        from pdfminer.high_level import extract_text
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
     except Exception as exc:  # noqa: BLE001
         raise RuntimeError(
             "pdfminer.six が必要です。`pip install -r requirements.txt` を実行してください"
@@ -52,33 +79,152 @@ def read_pdf_text(input_path: str, target_pages: Optional[Sequence[int]] = None)
 
     if target_pages:
         # pdfminerは0始まり指定のため変換
-        page_numbers_zero_based = [p - 1 for p in target_pages if p > 0]
+        page_numbers_zero_based = {p - 1 for p in target_pages if p > 0}
     else:
         page_numbers_zero_based = None
 
-    text = extract_text(input_path, page_numbers=page_numbers_zero_based)
-    if not text:
-        return ""
-    # 余分な空白を整形
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    opened = open(source, "rb") if isinstance(source, str) else contextlib.nullcontext(source)
+    with opened as fp, io.StringIO() as out:
+        rsrcmgr = PDFResourceManager()
+        device = TextConverter(rsrcmgr, out, laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for page in PDFPage.get_pages(fp, page_numbers_zero_based):
+            interpreter.process_page(page)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate(0)
+        device.close()
+
+
+def iter_pdf_text(
+    input_path: str,
+    target_pages: Optional[Sequence[int]] = None,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> Iterator[str]:
+    """空白を整形したテキストを断片ごとに返す（連結すると read_pdf_text と同じ文字列）。
+    cache_dir 指定時は (ファイル内容, ページ指定) のハッシュで抽出結果をキャッシュする。
+    refresh=True ならキャッシュを読まずに再抽出して上書きする。
+    """
+    with open(input_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise RuntimeError(f"空のファイルです: {input_path}")
+        # ファイルは一度だけメモリマップし、ハッシュ計算とPDF解析で同じバッファを使う
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from _iter_mapped_pdf_text(data, target_pages, cache_dir, refresh)
+
+
+def _iter_mapped_pdf_text(
+    data: mmap.mmap,
+    target_pages: Optional[Sequence[int]],
+    cache_dir: Optional[str],
+    refresh: bool,
+) -> Iterator[str]:
+    cache_path: Optional[str] = None
+    if cache_dir:
+        key = hashlib.sha1(
+            f"{hashlib.sha1(data).hexdigest()}\0{list(target_pages or [])}".encode("utf-8")
+        ).hexdigest()
+        cache_path = os.path.join(cache_dir, "text", f"{key}.txt")
+        if not refresh:
+            cached = cache_read(cache_path)
+            if cached is not None:
+                if cached:
+                    yield cached
+                return
+
+    # 抽出しながら一時ファイルへ書き出し、最後まで読めた場合のみキャッシュとして確定する
+    tmp = None
+    tmp_path = ""
+    if cache_path:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp = open(tmp_path, "w", encoding="utf-8")
+        except OSError:
+            tmp = None
+
+    try:
+        first = True
+        for page_text in iter_pdf_pages(data, target_pages):
+            # 余分な空白を整形（ページ境界も空白1つにまとめる）
+            page_text = " ".join(page_text.split())
+            if not page_text:
+                continue
+            piece = page_text if first else " " + page_text
+            first = False
+            if tmp:
+                tmp.write(piece)
+            yield piece
+        if tmp:
+            tmp.close()
+            tmp = None
+            os.replace(tmp_path, cache_path)
+    finally:
+        if tmp:
+            tmp.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
 
 
-def split_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+def read_pdf_text(
+    input_path: str,
+    target_pages: Optional[Sequence[int]] = None,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> str:
+    """pdfminer.sixを利用してテキスト抽出。
+    target_pages は1始まりのページ番号配列。
+    """
+    return "".join(iter_pdf_text(input_path, target_pages, cache_dir, refresh))
+
+
+def split_text(
+    text: Union[str, Iterable[str]],
+    chunk_size: int,
+    overlap: int,
+    max_tokens: int = 0,
+) -> Iterator[str]:
+    """テキスト（または順に連結されるテキスト断片）をチャンクに分割する。
+    断片はチャンク長+重なり分のバッファに溜めて逐次切り出すため、全文を連結しない。
+    max_tokens > 0 の場合は文字数ではなくトークン数で各チャンクを max_tokens に収める。
+    """
+    pieces = [text] if isinstance(text, str) else text
+    if max_tokens > 0:
+        chunk_size = max_tokens * MAX_CHARS_PER_TOKEN
     if chunk_size <= 0:
-        return [text]
+        yield "".join(pieces)
+        return
     if overlap < 0:
         overlap = 0
-    chunks: List[str] = []
+
+    def cut(candidate: str) -> str:
+        return fit_prefix_to_tokens(candidate, max_tokens) if max_tokens > 0 else candidate
+
+    def advance(chunk: str) -> int:
+        # トークン基準では切り出した文字数が重なり（文字数）以下になり得るため、
+        # 重なりはチャンク長の1/4までに抑えて毎回チャンクの大半ずつ進める
+        chunk_overlap = min(overlap, len(chunk) // 4) if max_tokens > 0 else overlap
+        return max(len(chunk) - chunk_overlap, 1)
+
+    buffer = ""
     start = 0
-    n = len(text)
-    while start < n:
-        end = min(start + chunk_size, n)
-        chunks.append(text[start:end])
-        if end == n:
+    for piece in pieces:
+        buffer = buffer[start:] + piece
+        start = 0
+        # 後続の文字が確定している間だけ切り出す（末尾チャンクは最後にまとめて出す）
+        while len(buffer) - start > chunk_size:
+            chunk = cut(buffer[start : start + chunk_size])
+            yield chunk
+            start += advance(chunk)
+    while len(buffer) > start:
+        chunk = cut(buffer[start:])
+        yield chunk
+        if start + len(chunk) >= len(buffer):
             break
-        start = max(end - overlap, start + 1)
-    return chunks
+        start += advance(chunk)
 
 
 def ensure_command_available(cmd: Optional[str]) -> str:
@@ -97,54 +243,246 @@ def ensure_command_available(cmd: Optional[str]) -> str:
     )
 
 
-def run_summarize_command(command: str, prompt: str, timeout_sec: int) -> str:
-    completed = subprocess.run(
-        command,
-        input=prompt.encode("utf-8"),
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        timeout=timeout_sec,
+def parse_command(cmd: str) -> List[str]:
+    """要約コマンド文字列を引数リストに分解する（シェルは経由しない）。"""
+    try:
+        argv = shlex.split(cmd)
+    except ValueError as exc:
+        raise RuntimeError(f"要約コマンドを解釈できません: {cmd} ({exc})") from exc
+    if not argv:
+        raise RuntimeError("要約コマンドが空です")
+    return argv
+
+
+async def arun_summarize_command(
+    command: Sequence[str],
+    prompt: str,
+    timeout_sec: int,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> str:
+    """要約コマンド（引数リスト）を非同期に実行する。
+    シェルを経由せずに起動し、stdin書き込みとstdout/stderr読み出しは並行して行われる。
+    """
+    cache_path: Optional[str] = None
+    if cache_dir:
+        key = hashlib.sha1(f"{shlex.join(command)}\0{prompt}".encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, "llm", f"{key}.md")
+        if not refresh:
+            cached = cache_read(cache_path)
+            if cached is not None:
+                return cached
+
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
     )
-    if completed.returncode != 0:
-        stderr_text = completed.stderr.decode("utf-8", errors="ignore")
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(prompt.encode("utf-8")), timeout_sec)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+        proc.kill()
+        await proc.wait()
+        if isinstance(exc, asyncio.TimeoutError):
+            raise subprocess.TimeoutExpired(list(command), timeout_sec) from None
+        raise
+    if proc.returncode != 0:
+        stderr_text = stderr.decode("utf-8", errors="ignore")
         raise RuntimeError(f"要約コマンド失敗: {stderr_text.strip()}")
-    return completed.stdout.decode("utf-8", errors="ignore").strip()
-
+    output = stdout.decode("utf-8", errors="ignore").strip()
+    # 空の出力（認証エラー等で終了コード0のまま何も返さない場合）はキャッシュしない
+    if cache_path and output:
+        cache_write(cache_path, output)
+    return output
+
+
+def run_summarize_command(
+    command: Sequence[str],
+    prompt: str,
+    timeout_sec: int,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> str:
+    return asyncio.run(arun_summarize_command(command, prompt, timeout_sec, cache_dir, refresh))
+
+
+class ChunkSummaryError(RuntimeError):
+    """チャンク要約の失敗。index は1始まりのチャンク番号。"""
+
+    def __init__(self, index: int, cause: BaseException) -> None:
+        super().__init__(str(cause))
+        self.index = index
+
+
+_T = TypeVar("_T")
+_END_OF_CHUNKS = object()
+
+
+async def summarize_chunks(
+    command: Sequence[str],
+    chunks: Iterable[_T],
+    build_prompt: Callable[[_T], str],
+    timeout_sec: int,
+    concurrency: int,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+) -> List[str]:
+    """チャンクを順に取り出しながら最大 concurrency 並列で要約し、入力順に結果を返す。
+    取り出しは空きができてから行い、プロンプトも実行直前に組み立てるため、
+    保持するのは実行中のチャンクと部分要約だけになる。
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    loop = asyncio.get_running_loop()
+    iterator = iter(chunks)
+    failed = False
 
-def build_chunk_prompt(language: str, extra_instruction: Optional[str], chunk_text: str) -> str:
+    async def run_one(index: int, chunk: _T) -> str:
+        nonlocal failed
+        try:
+            return await arun_summarize_command(command, build_prompt(chunk), timeout_sec, cache_dir, refresh)
+        except Exception as exc:  # noqa: BLE001
+            failed = True
+            raise ChunkSummaryError(index, exc) from exc
+        finally:
+            semaphore.release()
+
+    tasks: List["asyncio.Future[str]"] = []
+    try:
+        while True:
+            await semaphore.acquire()
+            if failed:
+                # 失敗したチャンクがあれば、以降のチャンクは取り出さない
+                break
+            # チャンクの取り出しはPDF解析（ブロッキング）を伴うため、実行中のコマンドを止めないよう別スレッドで行う
+            chunk = await loop.run_in_executor(None, next, iterator, _END_OF_CHUNKS)
+            if chunk is _END_OF_CHUNKS:
+                semaphore.release()
+                break
+            tasks.append(asyncio.ensure_future(run_one(len(tasks) + 1, chunk)))
+        return list(await asyncio.gather(*tasks))
+    finally:
+        # 失敗時は残りのコマンドを待たずに打ち切る
+        for task in tasks:
+            task.cancel()
+
+
+def build_chunk_prompt(
+    language: str,
+    extra_instruction: Optional[str],
+    chunk_text: str,
+    max_tokens: int = 0,
+) -> str:
+    """max_tokens > 0 ならプロンプト全体がそのトークン数に収まるようチャンク本文を削る。"""
     instruction = (
         extra_instruction.strip() + "\n\n"
         if extra_instruction and extra_instruction.strip()
         else ""
     )
-    return (
-        f"以下はPDFから抽出した一部テキストです。{language}でMarkdown要約してください。\n"
-        f"- 箇条書き中心で簡潔に\n"
-        f"- 重要な数値・期日・固有名詞は残す\n"
-        f"- 無関係なノイズは省く\n"
-        f"- 見出し（##）を付与\n\n"
-        f"{instruction}"
-        f"=== コンテンツ開始 ===\n{chunk_text}\n=== コンテンツ終了 ===\n"
-    )
 
+    # 固定の指示文を先頭、チャンク本文を末尾に置き、全チャンクで先頭部分を同一に保つ
+    # （LLM側のプロンプトキャッシュが効くように、可変部分は末尾以外に入れないこと）
+    def render(body: str) -> str:
+        return (
+            f"以下はPDFから抽出した一部テキストです。{language}でMarkdown要約してください。\n"
+            f"- 箇条書き中心で簡潔に\n"
+            f"- 重要な数値・期日・固有名詞は残す\n"
+            f"- 無関係なノイズは省く\n"
+            f"- 見出し（##）を付与\n\n"
+            f"{instruction}"
+            f"=== コンテンツ開始 ===\n{body}\n=== コンテンツ終了 ===\n"
+        )
+
+    return render_within_budget(render, chunk_text, max_tokens)
+
+
+def build_single_prompt(
+    language: str,
+    extra_instruction: Optional[str],
+    text: str,
+    max_tokens: int = 0,
+) -> str:
+    """1チャンクに収まる文書用。チャンク要約と最終要約の指示をまとめ、1回で最終形式を出力させる。"""
+    instruction = (
+        extra_instruction.strip() + "\n\n"
+        if extra_instruction and extra_instruction.strip()
+        else ""
+    )
 
-def build_final_prompt(language: str, extra_instruction: Optional[str], partial_markdowns: Sequence[str]) -> str:
+    def render(body: str) -> str:
+        return (
+            f"以下はPDFから抽出したテキスト全体です。{language}で最終Markdown要約を作成してください。\n"
+            f"- 章立て（##）と項目（- ）で構成し、箇条書き中心で簡潔に\n"
+            f"- 重要な数値・期日・固有名詞は残す\n"
+            f"- 無関係なノイズは省き、同義内容は統合\n"
+            f"- 最後に '## 要点' セクションで3-7行で箇条書き要点\n\n"
+            f"{instruction}"
+            f"=== コンテンツ開始 ===\n{body}\n=== コンテンツ終了 ===\n"
+        )
+
+    return render_within_budget(render, text, max_tokens)
+
+
+def build_final_prompt(
+    language: str,
+    extra_instruction: Optional[str],
+    partial_markdowns: Sequence[str],
+    max_tokens: int = 0,
+) -> str:
     instruction = (
         extra_instruction.strip() + "\n\n"
         if extra_instruction and extra_instruction.strip()
         else ""
     )
     joined = "\n\n\n".join(partial_markdowns)
-    return (
-        f"以下は複数チャンクの要約結果です。重複を排除し、{language}で最終Markdown要約を作成してください。\n"
-        f"- 章立て（##）と項目（- ）で構成\n"
-        f"- 同義内容を統合\n"
-        f"- 抜け・矛盾を可能な限り解消\n"
-        f"- 最後に '## 要点' セクションで3-7行で箇条書き要点\n\n"
-        f"{instruction}"
-        f"=== チャンク要約集約開始 ===\n{joined}\n=== 集約終了 ===\n"
-    )
+
+    def render(body: str) -> str:
+        return (
+            f"以下は複数チャンクの要約結果です。重複を排除し、{language}で最終Markdown要約を作成してください。\n"
+            f"- 章立て（##）と項目（- ）で構成\n"
+            f"- 同義内容を統合\n"
+            f"- 抜け・矛盾を可能な限り解消\n"
+            f"- 最後に '## 要点' セクションで3-7行で箇条書き要点\n\n"
+            f"{instruction}"
+            f"=== チャンク要約集約開始 ===\n{body}\n=== 集約終了 ===\n"
+        )
+
+    return render_within_budget(render, joined, max_tokens)
+
+
+async def reduce_summaries(
+    command: Sequence[str],
+    language: str,
+    extra_instruction: Optional[str],
+    partials: Sequence[str],
+    timeout_sec: int,
+    concurrency: int,
+    fan_in: int,
+    max_tokens: int = 0,
+    cache_dir: Optional[str] = None,
+    refresh: bool = False,
+    max_prompt_tokens: int = 0,
+) -> str:
+    """部分要約を fan_in 件ずつ統合する処理を1件になるまで繰り返す（各段は並列実行）。
+    max_tokens はグループ分けの目安、max_prompt_tokens は1回のプロンプトの上限。
+    """
+    level = list(partials)
+    while len(level) > 1:
+        groups = group_for_merge(level, fan_in, max_tokens)
+        merged = iter(
+            await summarize_chunks(
+                command,
+                [group for group in groups if len(group) > 1],
+                lambda group: build_final_prompt(language, extra_instruction, group, max_prompt_tokens),
+                timeout_sec,
+                concurrency,
+                cache_dir,
+                refresh,
+            )
+        )
+        # 1件だけのグループは統合せず次の段へそのまま渡す
+        level = [next(merged) if len(group) > 1 else group[0] for group in groups]
+    return level[0]
 
 
 def default_output_path(input_pdf: str, output_dir: Optional[str]) -> str:
@@ -179,11 +517,23 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         "--overlap",
         type=int,
         default=400,
-        help="チャンク重なり（文字数）",
+        help="チャンク重なり（文字数。--context-tokens指定時は各チャンク長の1/4まで）",
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=0,
+        help="モデルのコンテキスト長（トークン）。指定時はトークン数基準でチャンク分割（--chunk-sizeは無視）",
+    )
+    parser.add_argument(
+        "--max-output-tokens",
+        type=int,
+        default=1024,
+        help="1回の出力に見込むトークン数（--context-tokens指定時のチャンク長計算に使用）",
     )
     parser.add_argument(
         "--cmd",
-        help="要約に使う外部コマンド（Cursor CLI等）。stdinを受け取りstdoutに要約を出力すること",
+        help="要約に使う外部コマンド（Cursor CLI等）。stdinを受け取りstdoutに要約を出力すること（シェルを経由しないためパイプ等は不可）",
     )
     parser.add_argument(
         "--timeout",
@@ -191,6 +541,18 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         default=300,
         help="外部コマンドのタイムアウト秒",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="チャンク要約の同時実行数（既定: min(8, チャンク数)）",
+    )
+    parser.add_argument(
+        "--merge-fan-in",
+        type=int,
+        default=4,
+        help="1回の統合でまとめる部分要約の最大数（段階的に統合）",
+    )
     parser.add_argument(
         "--output",
         help="出力Markdownパス。未指定なら自動命名",
@@ -213,8 +575,19 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         "--output-dir",
         help="出力ディレクトリ（--output未指定時に使用）",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="抽出テキスト/要約結果のキャッシュを使わない",
+    )
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="キャッシュを読まずに再実行し、結果でキャッシュを更新",
+    )
 
     args = parser.parse_args(argv)
+    cache_dir = None if args.no_cache else default_cache_dir()
 
     input_pdf = os.path.abspath(args.input)
     if not os.path.exists(input_pdf):
@@ -227,41 +600,113 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         print(str(e), file=sys.stderr)
         return 2
 
+    extra_instruction = load_prompt_file(args.prompt_file)
+
+    # プロンプト全体の上限（出力分を残す）。超える場合は本文の中央を削って収める
+    prompt_budget = args.context_tokens - args.max_output_tokens if args.context_tokens > 0 else 0
+    chunk_tokens = 0
+    if args.context_tokens > 0:
+        # コンテキスト長から固定のプロンプト部分と出力分を差し引いた残りをチャンクに割り当てる
+        prompt_overhead = count_fixed_tokens(build_chunk_prompt(args.language, extra_instruction, ""))
+        chunk_tokens = args.context_tokens - prompt_overhead - args.max_output_tokens
+        if chunk_tokens <= 0:
+            print(
+                f"--context-tokens が小さすぎます（プロンプト{prompt_overhead} + 出力{args.max_output_tokens}トークン）",
+                file=sys.stderr,
+            )
+            return 2
+    elif args.overlap >= args.chunk_size:
+        print(f"--overlap（{args.overlap}）は --chunk-size（{args.chunk_size}）より小さくしてください", file=sys.stderr)
+        return 2
+
+    # ページ単位の抽出結果をそのままチャンク分割に流し、全文やチャンクの一覧を一度に保持しない
+    chunks = split_text(
+        iter_pdf_text(input_pdf, target_pages, cache_dir, args.force_refresh),
+        args.chunk_size,
+        args.overlap,
+        chunk_tokens,
+    )
     try:
-        raw_text = read_pdf_text(input_pdf, target_pages)
+        # 1チャンクで終わるかどうかだけ先に確かめる
+        first_chunk = next(chunks, "")
+        second_chunk = next(chunks, None)
     except Exception as e:  # noqa: BLE001
         print(f"PDF抽出エラー: {e}", file=sys.stderr)
         return 1
 
-    if not raw_text:
+    if not first_chunk:
         print("PDFからテキストを抽出できませんでした", file=sys.stderr)
         return 1
 
-    chunks = split_text(raw_text, args.chunk_size, args.overlap)
-    extra_instruction = load_prompt_file(args.prompt_file)
-
     try:
-        summarize_cmd = ensure_command_available(args.cmd)
+        # コマンドは一度だけ引数リストに分解し、各呼び出しではシェルを起動しない
+        summarize_cmd = parse_command(ensure_command_available(args.cmd))
     except RuntimeError as e:
         print(str(e), file=sys.stderr)
         return 2
 
-    partial_markdowns: List[str] = []
-    for idx, chunk in enumerate(chunks, start=1):
-        prompt = build_chunk_prompt(args.language, extra_instruction, chunk)
+    if second_chunk is None:
+        # 1チャンクに収まる文書は分割→統合を行わず、最終形式のプロンプトで1回だけ要約する
+        single_prompt = build_single_prompt(
+            args.language, extra_instruction, first_chunk, max_tokens=prompt_budget
+        )
+        try:
+            final_markdown = run_summarize_command(
+                summarize_cmd, single_prompt, args.timeout, cache_dir, args.force_refresh
+            )
+        except Exception as e:  # noqa: BLE001
+            print(f"要約エラー: {e}", file=sys.stderr)
+            return 1
+    else:
+        # チャンク要約は互いに独立なので並列に実行し、結果は元の順序で回収する
+        concurrency = args.concurrency or 8
+        build_prompt = functools.partial(
+            build_chunk_prompt, args.language, extra_instruction, max_tokens=prompt_budget
+        )
         try:
-            md = run_summarize_command(summarize_cmd, prompt, args.timeout)
+            partial_markdowns = asyncio.run(
+                summarize_chunks(
+                    summarize_cmd,
+                    itertools.chain((first_chunk, second_chunk), chunks),
+                    build_prompt,
+                    args.timeout,
+                    concurrency,
+                    cache_dir,
+                    args.force_refresh,
+                )
+            )
+        except ChunkSummaryError as e:
+            print(f"要約エラー（チャンク{e.index}）: {e}", file=sys.stderr)
+            return 1
         except Exception as e:  # noqa: BLE001
-            print(f"要約エラー（チャンク{idx}/{len(chunks)}）: {e}", file=sys.stderr)
+            print(f"PDF抽出エラー: {e}", file=sys.stderr)
             return 1
-        partial_markdowns.append(md)
 
-    final_prompt = build_final_prompt(args.language, extra_instruction, partial_markdowns)
-    try:
-        final_markdown = run_summarize_command(summarize_cmd, final_prompt, args.timeout)
-    except Exception as e:  # noqa: BLE001
-        print(f"最終要約エラー: {e}", file=sys.stderr)
-        return 1
+        # 部分要約が多い場合に1回のプロンプトへ詰め込まないよう、段階的に統合する
+        max_merge_tokens = 0
+        if args.context_tokens > 0:
+            max_merge_tokens = int(args.context_tokens * 0.7) - count_fixed_tokens(
+                build_final_prompt(args.language, extra_instruction, [])
+            )
+        try:
+            final_markdown = asyncio.run(
+                reduce_summaries(
+                    summarize_cmd,
+                    args.language,
+                    extra_instruction,
+                    partial_markdowns,
+                    args.timeout,
+                    concurrency,
+                    args.merge_fan_in,
+                    max_merge_tokens,
+                    cache_dir,
+                    args.force_refresh,
+                    prompt_budget,
+                )
+            )
+        except Exception as e:  # noqa: BLE001
+            print(f"最終要約エラー: {e}", file=sys.stderr)
+            return 1
 
     if args.stdout:
         print(final_markdown)
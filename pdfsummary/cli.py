@@ -1,12 +1,35 @@
 import argparse
 import datetime
+import functools
+import hashlib
+import json
+import mmap
 import os
+import re
+import shlex
 import shutil
 import subprocess
 import sys
-from typing import List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from pdfminer.high_level import extract_text
+if not __package__:
+	# `python3 pdfsummary/cli.py` としてスクリプト実行された場合も pdfsummary パッケージを import できるようにする
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdfsummary.common import (
+	MAX_CHARS_PER_TOKEN,
+	cache_read,
+	cache_write,
+	count_fixed_tokens,
+	count_tokens,
+	default_cache_dir,
+	fit_prefix_to_tokens,
+	group_for_merge,
+	render_within_budget,
+)
 
 
 class _SafeDict(dict):
@@ -26,56 +49,125 @@ def _read_text_if_file(path: Optional[str]) -> Optional[str]:
 		return f.read()
 
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-	return extract_text(pdf_path) or ""
+def extract_text_from_pdf(pdf_path: str, cache_dir: Optional[str] = None, refresh: bool = False) -> str:
+	with open(pdf_path, "rb") as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			return ""
+		cache_path: Optional[str] = None
+		if cache_dir:
+			# ハッシュ計算はメモリマップ上で行い、ファイル全体を bytes として読み込まない
+			with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				digest = hashlib.sha1(data).hexdigest()
+			cache_path = os.path.join(cache_dir, "text", f"{digest}.txt")
+			if not refresh:
+				cached = cache_read(cache_path)
+				if cached is not None:
+					return cached
+		# pdfminer は読み込みが重いため、--help 等やキャッシュ命中で終わる場合は import しない
+		try:
+			from pdfminer.high_level import extract_text
+		except Exception as e:
+			raise RuntimeError("pdfminer.six が必要です。`pip install -r requirements.txt` を実行してください") from e
+		# high_level.extract_text は mmap を受け付けないため、開いているファイルをそのまま渡す
+		f.seek(0)
+		text = extract_text(f) or ""
+	if cache_path and text.strip():
+		cache_write(cache_path, text)
+	return text
+
+
+_JP_RANGES = [
+	(0x3040, 0x309F),  # ひらがな
+	(0x30A0, 0x30FF),  # カタカナ
+	(0x4E00, 0x9FFF),  # CJK統合漢字
+	(0x3000, 0x303F),  # CJK記号・句読点
+]
+# 日本語の文字を削除する変換表（削除前後の長さの差が日本語の文字数）
+_JP_DELETE_TABLE = {cp: None for a, b in _JP_RANGES for cp in range(a, b + 1)}
+
+
+# 言語判定に使う先頭部分の長さと、早期判定のための走査単位
+_JP_SAMPLE_CHARS = 2048
+_JP_SCAN_BLOCK = 256
 
 
 def _is_likely_japanese(text: str) -> bool:
 	# 判定: 日本語の文字（ひらがな/カタカナ/漢字/全角記号）が一定量含まれる
+	# 出力全体ではなく先頭 _JP_SAMPLE_CHARS 文字で判定し、閾値に達した時点で打ち切る
 	if not text:
 		return False
-	jp_ranges = [
-		(0x3040, 0x309F),  # ひらがな
-		(0x30A0, 0x30FF),  # カタカナ
-		(0x4E00, 0x9FFF),  # CJK統合漢字
-		(0x3000, 0x303F),  # CJK記号・句読点
-	]
+	sample = text[:_JP_SAMPLE_CHARS]
 	jp_count = 0
-	for ch in text:
-		cp = ord(ch)
-		for a, b in jp_ranges:
-			if a <= cp <= b:
-				jp_count += 1
-				break
-	# 閾値: 最低10文字、または全体に対し1%以上
-	return jp_count >= 10 or (jp_count / max(len(text), 1)) >= 0.01
+	for i in range(0, len(sample), _JP_SCAN_BLOCK):
+		block = sample[i : i + _JP_SCAN_BLOCK]
+		jp_count += len(block) - len(block.translate(_JP_DELETE_TABLE))
+		if jp_count >= 10:
+			return True
+	# 閾値: 最低10文字、または全体に対し1%以上（jp_count / len >= 0.01 を整数演算で）
+	return jp_count * 100 >= len(sample)
+
 
+def _split_by_tokens(text: str, max_tokens: int, model: str) -> List[str]:
+	# max_tokens に収まる最長の先頭部分を切り出していく。
+	# 残り全体ではなく候補幅だけを数えることで、長い段落でもトークン化の量を線形に抑える
+	pieces: List[str] = []
+	while text:
+		piece = fit_prefix_to_tokens(text[: max_tokens * MAX_CHARS_PER_TOKEN], max_tokens, model)
+		pieces.append(piece)
+		text = text[len(piece) :]
+	return pieces
 
-def chunk_text(text: str, max_chars: int = 6000) -> List[str]:
+
+def _iter_paragraphs(text: str) -> Iterator[str]:
+	# text.split("\n\n") と同じ区切りで、段落リストを作らずに1つずつ返す
+	start = 0
+	while True:
+		end = text.find("\n\n", start)
+		p = (text[start:] if end == -1 else text[start:end]).strip()
+		if p:
+			yield p
+		if end == -1:
+			return
+		start = end + 2
+
+
+def chunk_text(text: str, max_chars: int = 6000, max_tokens: int = 0, model: str = "") -> List[str]:
+	"""段落単位でチャンクにまとめる。max_tokens > 0 なら文字数ではなくトークン数で上限を判定"""
 	if not text:
 		return []
-	paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+	limit = max_tokens if max_tokens > 0 else max_chars
+
+	def measure(s: str) -> int:
+		return count_tokens(s, model) if max_tokens > 0 else len(s)
+
+	def split_long(s: str) -> List[str]:
+		if max_tokens > 0:
+			return _split_by_tokens(s, max_tokens, model)
+		return [s[i : i + max_chars] for i in range(0, len(s), max_chars)]
+
 	chunks: List[str] = []
 	current: List[str] = []
 	current_len = 0
-	for p in paragraphs:
+	for p in _iter_paragraphs(text):
+		p_len = measure(p)
 		# 長すぎる段落は強制分割
-		if len(p) > max_chars:
-			for i in range(0, len(p), max_chars):
-				piece = p[i : i + max_chars]
+		if p_len > limit:
+			for piece in split_long(p):
 				if current:
 					chunks.append("\n\n".join(current))
 					current = []
 					current_len = 0
 				chunks.append(piece)
 			continue
-		if current_len + len(p) + (2 if current else 0) <= max_chars:
+		# 区切り（"\n\n"）の長さは追加前に判定する（追加後だと常に加算されてしまう）
+		sep = 2 if current else 0
+		if current_len + p_len + sep <= limit:
 			current.append(p)
-			current_len += len(p) + (2 if current else 0)
+			current_len += p_len + sep
 		else:
 			chunks.append("\n\n".join(current))
 			current = [p]
-			current_len = len(p)
+			current_len = p_len
 	if current:
 		chunks.append("\n\n".join(current))
 	return chunks
@@ -85,30 +177,191 @@ def which(cmd: str) -> bool:
 	return shutil.which(cmd) is not None
 
 
-def run_cmd_with_stdin(cmd_str: str, input_text: str) -> str:
-	"""汎用: 任意コマンドにSTDINでプロンプト/本文を渡し、その標準出力を返す"""
-	completed = subprocess.run(
-		cmd_str,
-		input=input_text.encode("utf-8"),
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE,
-		shell=True,
-		check=False,
-	)
+@functools.lru_cache(maxsize=None)
+def _split_command(cmd_str: str) -> Tuple[str, ...]:
+	# コマンド文字列の分解は文字列ごとに1回だけ行う
+	argv = tuple(shlex.split(cmd_str))
+	if not argv:
+		raise RuntimeError("実行コマンドが空です")
+	return argv
+
+
+def run_cmd_with_stdin(cmd: Union[str, Sequence[str]], input_text: str) -> str:
+	"""汎用: 任意コマンドにSTDINでプロンプト/本文を渡し、その標準出力を返す（シェルは経由しない）"""
+	argv = _split_command(cmd) if isinstance(cmd, str) else cmd
+	try:
+		completed = subprocess.run(
+			argv,
+			input=input_text.encode("utf-8"),
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE,
+			check=False,
+		)
+	except FileNotFoundError as e:
+		raise RuntimeError(f"Command not found: {argv[0]}") from e
 	if completed.returncode != 0:
 		raise RuntimeError(
-			f"Command failed: {cmd_str}\nSTDERR: {completed.stderr.decode('utf-8', errors='ignore')}"
+			f"Command failed: {shlex.join(argv)}\nSTDERR: {completed.stderr.decode('utf-8', errors='ignore')}"
 		)
 	return completed.stdout.decode("utf-8", errors="ignore").strip()
 
 
-def summarize_with_ollama(prompt: str, model: str) -> str:
-	if not which("ollama"):
-		raise RuntimeError("ollama コマンドが見つかりません")
+_OLLAMA_LOCAL = threading.local()
+_OLLAMA_SERVER_LOCK = threading.Lock()
+_OLLAMA_SERVER_READY: Optional[bool] = None
+
+
+def _ollama_address() -> Tuple[str, int]:
+	# ollama 本体と同じく OLLAMA_HOST（例: 127.0.0.1:11434, http://host:port）を参照
+	import urllib.parse
+
+	host = os.getenv("OLLAMA_HOST") or "127.0.0.1:11434"
+	parsed = urllib.parse.urlsplit(host if "://" in host else f"http://{host}")
+	hostname = parsed.hostname or "127.0.0.1"
+	if hostname == "0.0.0.0":
+		hostname = "127.0.0.1"
+	return hostname, parsed.port or 11434
+
+
+def _ollama_open(method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> "http.client.HTTPResponse":
+	"""ollama HTTP API へリクエストを送り、未読のレスポンスを返す。接続はスレッドごとに保持して使い回す（HTTP keep-alive）"""
+	# http.client は email パッケージごと読み込まれて重いため、ollama を使う時だけ import する
+	import http.client
+
+	body = json.dumps(payload).encode("utf-8") if payload is not None else None
+	headers = {"Content-Type": "application/json"} if body is not None else {}
+	for attempt in range(2):
+		conn = getattr(_OLLAMA_LOCAL, "conn", None)
+		if conn is None:
+			conn = http.client.HTTPConnection(*_ollama_address())
+			_OLLAMA_LOCAL.conn = conn
+		try:
+			conn.request(method, path, body=body, headers=headers)
+			return conn.getresponse()
+		except (http.client.HTTPException, OSError):
+			conn.close()
+			_OLLAMA_LOCAL.conn = None
+			# 保持していた接続がサーバ側で閉じられていた場合に備え、1度だけ張り直す
+			if attempt:
+				raise
+	raise RuntimeError("unreachable")
+
+
+def _ollama_request(method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+	resp = _ollama_open(method, path, payload)
+	return resp.status, resp.read()
+
+
+def _ollama_discard_connection() -> None:
+	# レスポンスを読み切らずに終えた接続は再利用できないため閉じる
+	conn = getattr(_OLLAMA_LOCAL, "conn", None)
+	if conn is not None:
+		conn.close()
+		_OLLAMA_LOCAL.conn = None
+
+
+def _ollama_generate_stream(
+	payload: Dict[str, Any], on_token: Optional[Callable[[str], None]]
+) -> Tuple[int, str, bool]:
+	"""/api/generate をストリーミングで呼び、届いた断片を on_token に渡しながら連結して返す。
+	3つ目の値は生成が num_predict の上限で打ち切られたかどうか
+	"""
+	resp = _ollama_open("POST", "/api/generate", {**payload, "stream": True})
+	if resp.status != 200:
+		return resp.status, resp.read().decode("utf-8", errors="ignore"), False
+	pieces: List[str] = []
+	finished = False
+	truncated = False
+	try:
+		# 1行に1つのJSONオブジェクト（NDJSON）で届く
+		for line in iter(resp.readline, b""):
+			if not line.strip():
+				continue
+			event = json.loads(line)
+			if event.get("error"):
+				raise RuntimeError(f"ollama API エラー: {event['error']}")
+			piece = event.get("response") or ""
+			if piece:
+				pieces.append(piece)
+				if on_token is not None:
+					on_token(piece)
+			if event.get("done"):
+				truncated = event.get("done_reason") == "length"
+				resp.read()
+				finished = True
+				break
+	finally:
+		if not finished:
+			_ollama_discard_connection()
+	return 200, "".join(pieces), truncated
+
+
+def _ollama_server_alive() -> bool:
+	import http.client
+
+	try:
+		status, _ = _ollama_request("GET", "/api/version")
+	except (http.client.HTTPException, OSError):
+		return False
+	return status == 200
+
+
+def _ensure_ollama_server() -> bool:
+	"""ollama サーバが応答するか確認し、無ければ `ollama serve` をバックグラウンドで起動する"""
+	global _OLLAMA_SERVER_READY
+	with _OLLAMA_SERVER_LOCK:
+		if _OLLAMA_SERVER_READY is None:
+			ready = _ollama_server_alive()
+			if not ready and which("ollama"):
+				subprocess.Popen(
+					["ollama", "serve"],
+					stdin=subprocess.DEVNULL,
+					stdout=subprocess.DEVNULL,
+					stderr=subprocess.DEVNULL,
+					start_new_session=True,
+				)
+				for _ in range(50):
+					time.sleep(0.2)
+					if _ollama_server_alive():
+						ready = True
+						break
+			_OLLAMA_SERVER_READY = ready
+		return _OLLAMA_SERVER_READY
+
+
+def summarize_with_ollama(
+	prompt: str, model: str, output_token_limit: int = 0, on_token: Optional[Callable[[str], None]] = None
+) -> Tuple[str, bool]:
+	"""ollama で要約し、(出力, 出力が完結したか) を返す。output_token_limit で打ち切られた場合は False"""
 	if not model:
 		model = "hf.co/SakanaAI/TinySwallow-1.5B-Instruct-GGUF:latest" # Default model
-	cmd = f"ollama run {model}"
-	return run_cmd_with_stdin(cmd, prompt)
+	# モデルをメモリに残し、チャンク間で共通のプロンプト先頭部分のKVキャッシュを再利用させる
+	keepalive = os.getenv("PDFSUMMARY_OLLAMA_KEEPALIVE", "30m")
+	# 常駐サーバのHTTP APIを使い、呼び出しごとのプロセス起動・モデル読み込みを避ける
+	if _ensure_ollama_server():
+		payload: Dict[str, Any] = {"model": model, "prompt": prompt, "keep_alive": keepalive}
+		if output_token_limit > 0:
+			# 生成トークン数の上限はサーバ側で打ち切らせる（不要に長い出力の生成時間を省く）
+			payload["options"] = {"num_predict": output_token_limit}
+		status, text, truncated = _ollama_generate_stream(payload, on_token)
+		if status == 200:
+			if truncated:
+				limit = f"（{output_token_limit}トークン）" if output_token_limit > 0 else ""
+				print(f"警告: ollama の出力が上限{limit}で打ち切られました", file=sys.stderr)
+			return text.strip(), not truncated
+		# 404（モデル未取得）は pull まで行う `ollama run` に任せる
+		if status != 404 or not which("ollama"):
+			raise RuntimeError(f"ollama API エラー ({status}): {text}")
+	if not which("ollama"):
+		raise RuntimeError("ollama コマンドが見つかりません")
+	return run_cmd_with_stdin(["ollama", "run", "--keepalive", keepalive, model], prompt), True
+
+
+def _prompt_cache_key(system_prompt: str, prompt: str) -> str:
+	# 組み込みプロンプト/テンプレートは固定の指示文の後に "[PDF部分]" 等の見出し行から可変部分が続くため、
+	# その手前までを共通の先頭部分とみなす
+	prefix = prompt.split("\n[", 1)[0]
+	return hashlib.sha1(f"{system_prompt}\0{prefix}".encode("utf-8")).hexdigest()
 
 
 def summarize_with_openai(prompt: str, model: str, system_prompt: str) -> str:
@@ -127,34 +380,115 @@ def summarize_with_openai(prompt: str, model: str, system_prompt: str) -> str:
 			{"role": "user", "content": prompt},
 		],
 		temperature=0.2,
+		# 共通の先頭部分が同じリクエストを同じキャッシュへ振り分けてもらう
+		extra_body={"prompt_cache_key": _prompt_cache_key(system_prompt, prompt)},
 	)
 	return (resp.choices[0].message.content or "").strip()
 
 
-def auto_summarize(prompt: str, llm: str, model: str, cmd: Optional[str], system_prompt: str) -> str:
+def _llm_cache_path(
+	cache_dir: str, prompt: str, llm: str, model: str, cmd: Optional[str], system_prompt: str, output_token_limit: int
+) -> str:
+	key_parts = [llm, model, cmd or os.getenv("PDFSUMMARY_LLM_CMD", ""), system_prompt, prompt]
+	if output_token_limit > 0:
+		key_parts.append(str(output_token_limit))
+	key_src = "\0".join(key_parts)
+	return os.path.join(cache_dir, "llm", f"{hashlib.sha1(key_src.encode('utf-8')).hexdigest()}.md")
+
+
+def auto_summarize(
+	prompt: str,
+	llm: str,
+	model: str,
+	cmd: Optional[str],
+	system_prompt: str,
+	cache_dir: Optional[str] = None,
+	refresh: bool = False,
+	output_token_limit: int = 0,
+	on_token: Optional[Callable[[str], None]] = None,
+) -> str:
+	"""LLM呼び出し。cache_dir 指定時は (実行方法, モデル, コマンド, プロンプト) のハッシュで結果をキャッシュ
+
+	on_token は ollama の出力断片を届いた順に受け取る（他の実行方法やキャッシュ命中時は呼ばれない）。
+	output_token_limit で打ち切られた出力はキャッシュしない。
+	"""
+	if not cache_dir:
+		return _dispatch_summarize(prompt, llm, model, cmd, system_prompt, output_token_limit, on_token)[0]
+	cache_path = _llm_cache_path(cache_dir, prompt, llm, model, cmd, system_prompt, output_token_limit)
+	if not refresh:
+		cached = cache_read(cache_path)
+		if cached is not None:
+			return cached
+	md, complete = _dispatch_summarize(prompt, llm, model, cmd, system_prompt, output_token_limit, on_token)
+	if md and complete:
+		cache_write(cache_path, md)
+	return md
+
+
+def _dispatch_summarize(
+	prompt: str,
+	llm: str,
+	model: str,
+	cmd: Optional[str],
+	system_prompt: str,
+	output_token_limit: int = 0,
+	on_token: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, bool]:
 	if llm == "ollama":
-		return summarize_with_ollama(prompt, model)
+		return summarize_with_ollama(prompt, model, output_token_limit, on_token)
 	if llm == "openai":
-		return summarize_with_openai(prompt, model, system_prompt)
+		return summarize_with_openai(prompt, model, system_prompt), True
 	if llm == "cmd":
 		if not cmd:
 			raise RuntimeError("--cmd または PDFSUMMARY_LLM_CMD が必要です")
-		return run_cmd_with_stdin(cmd, prompt)
+		return run_cmd_with_stdin(cmd, prompt), True
 
 	# auto
 	env_cmd = cmd or os.getenv("PDFSUMMARY_LLM_CMD")
 	if env_cmd:
-		return run_cmd_with_stdin(env_cmd, prompt)
+		return run_cmd_with_stdin(env_cmd, prompt), True
 	if which("ollama"):
-		return summarize_with_ollama(prompt, model or "hf.co/SakanaAI/TinySwallow-1.5B-Instruct-GGUF:latest")
+		return summarize_with_ollama(
+			prompt, model or "hf.co/SakanaAI/TinySwallow-1.5B-Instruct-GGUF:latest", output_token_limit, on_token
+		)
 	if os.getenv("OPENAI_API_KEY"):
-		return summarize_with_openai(prompt, model or "gpt-4o-mini", system_prompt)
+		return summarize_with_openai(prompt, model or "gpt-4o-mini", system_prompt), True
 	raise RuntimeError(
 		"LLMの実行方法が見つかりません。ollama または OPENAI_API_KEY または PDFSUMMARY_LLM_CMD を設定してください。"
 	)
 
 
-def build_chunk_prompt(chunk: str, max_bullets: int, template_path: Optional[str]) -> str:
+def summarize_ensuring_ja(
+	prompt: str,
+	llm: str,
+	model: str,
+	cmd: Optional[str],
+	system_prompt: str,
+	ensure_ja: bool,
+	ja_retries: int,
+	cache_dir: Optional[str] = None,
+	refresh: bool = False,
+	output_token_limit: int = 0,
+) -> str:
+	md = auto_summarize(prompt, llm, model, cmd, system_prompt, cache_dir, refresh, output_token_limit)
+	if ensure_ja and not _is_likely_japanese(md):
+		for _ in range(max(ja_retries, 0)):
+			retry_prompt = prompt + "\n\n注意: 前回の出力は日本語ではありませんでした。出力は必ず日本語のみで、英語は使用しないでください。"
+			# リトライは毎回同じプロンプトになるため、キャッシュは読まずに再生成する
+			md = auto_summarize(retry_prompt, llm, model, cmd, system_prompt, cache_dir, True, output_token_limit)
+			if _is_likely_japanese(md):
+				# 元のプロンプトのキャッシュを日本語の結果で置き換え、次回以降のリトライを省く
+				if cache_dir:
+					cache_write(_llm_cache_path(cache_dir, prompt, llm, model, cmd, system_prompt, output_token_limit), md)
+				break
+	return md
+
+
+def build_chunk_prompt(
+	chunk: str, max_bullets: int, template_path: Optional[str], max_tokens: int = 0, model: str = ""
+) -> str:
+	if max_tokens > 0:
+		return render_within_budget(lambda body: build_chunk_prompt(body, max_bullets, template_path), chunk, max_tokens, model)
 	tpl = _read_text_if_file(template_path)
 	if tpl:
 		return tpl.format_map(_SafeDict({
@@ -170,14 +504,109 @@ def build_chunk_prompt(chunk: str, max_bullets: int, template_path: Optional[str
 	)
 
 
+def build_batched_chunk_prompt(chunks: List[str], max_bullets: int) -> str:
+	"""複数チャンクを1回の呼び出しで要約させるプロンプト（出力はJSONの要約配列）"""
+	# 指示文はチャンク数に依存させず、バッチ間で同一の先頭部分（プロバイダ側のプロンプトキャッシュ対象）にする
+	lines: List[str] = []
+	lines.append("以下はPDFテキストの一部を複数のチャンクに分けたものです。チャンクごとに重要情報を落とさず、日本語で簡潔にMarkdown要約してください。")
+	lines.append(f"- 各要約は箇条書き優先（最大{max_bullets}点）。数値・日付・固有名詞は保持。")
+	lines.append("- 出力は必ず日本語。英語は禁止。")
+	lines.append('- 出力はJSONのみ: {"summaries": ["CHUNK 1の要約", "CHUNK 2の要約", ...]}（各要約はMarkdown文字列。チャンクと同じ順序・同じ個数）\n')
+	lines.append(f"[チャンク数: {len(chunks)}]\n")
+	for i, chunk in enumerate(chunks, start=1):
+		lines.append(f"[CHUNK {i}]\n{chunk}\n")
+	return "\n".join(lines)
+
+
+def parse_batched_summaries(output: str, expected: int) -> Optional[List[str]]:
+	# 前後に余計な文章やコードフェンスが付いても読めるよう、最初に解釈できたJSONオブジェクトを使う
+	decoder = json.JSONDecoder()
+	pos = output.find("{")
+	while pos != -1:
+		try:
+			obj, _ = decoder.raw_decode(output, pos)
+		except ValueError:
+			pos = output.find("{", pos + 1)
+			continue
+		summaries = obj.get("summaries") if isinstance(obj, dict) else None
+		if isinstance(summaries, list) and len(summaries) == expected and all(isinstance(x, str) for x in summaries):
+			return [x.strip() for x in summaries]
+		return None
+	return None
+
+
+def group_chunks_for_batch(chunks: List[str], max_bullets: int, batch_size: int, max_prompt_tokens: int, model: str) -> List[List[str]]:
+	"""最大 batch_size 個、かつ max_prompt_tokens（>0 の場合）に収まるようにチャンクをまとめる"""
+	# 固定の指示文は一度だけ数え、各チャンクは自身の区切り行を含む部分だけを数えて加算する
+	overhead = count_fixed_tokens(build_batched_chunk_prompt([], max_bullets), model) if max_prompt_tokens > 0 else 0
+	groups: List[List[str]] = []
+	current: List[str] = []
+	current_tokens = overhead
+	for chunk in chunks:
+		chunk_tokens = count_tokens(f"[CHUNK {len(current) + 1}]\n{chunk}\n\n", model) if max_prompt_tokens > 0 else 0
+		if current and (len(current) >= batch_size or (max_prompt_tokens > 0 and current_tokens + chunk_tokens > max_prompt_tokens)):
+			groups.append(current)
+			current = []
+			current_tokens = overhead
+			chunk_tokens = count_tokens(f"[CHUNK 1]\n{chunk}\n\n", model) if max_prompt_tokens > 0 else 0
+		current.append(chunk)
+		current_tokens += chunk_tokens
+	if current:
+		groups.append(current)
+	return groups
+
+
+def summarize_chunk_batch(
+	chunks: List[str],
+	max_bullets: int,
+	model: str,
+	system_prompt: str,
+	ensure_ja: bool,
+	ja_retries: int,
+	cache_dir: Optional[str] = None,
+	refresh: bool = False,
+) -> List[str]:
+	"""OpenAIで複数チャンクをまとめて要約。JSONとして解釈できなければチャンクごとの要約に切り替える"""
+	summaries: Optional[List[str]] = None
+	if len(chunks) > 1:
+		output = auto_summarize(build_batched_chunk_prompt(chunks, max_bullets), "openai", model, None, system_prompt, cache_dir, refresh)
+		summaries = parse_batched_summaries(output, len(chunks))
+	if summaries is None:
+		summaries = [""] * len(chunks)
+	for i, chunk in enumerate(chunks):
+		if summaries[i] and (not ensure_ja or _is_likely_japanese(summaries[i])):
+			continue
+		summaries[i] = summarize_ensuring_ja(
+			build_chunk_prompt(chunk, max_bullets, None),
+			"openai",
+			model,
+			None,
+			system_prompt,
+			ensure_ja,
+			ja_retries,
+			cache_dir,
+			refresh,
+		)
+	return summaries
+
+
 def build_merge_prompt(
 	partials_md: List[str],
 	max_bullets: int,
 	include_actions: bool,
 	include_risks: bool,
 	template_path: Optional[str],
+	max_tokens: int = 0,
+	model: str = "",
 ) -> str:
 	joined = "\n\n".join(partials_md)
+	if max_tokens > 0:
+		return render_within_budget(
+			lambda body: build_merge_prompt([body], max_bullets, include_actions, include_risks, template_path),
+			joined,
+			max_tokens,
+			model,
+		)
 	tpl = _read_text_if_file(template_path)
 	if tpl:
 		return tpl.format_map(_SafeDict({
@@ -200,7 +629,32 @@ def build_merge_prompt(
 	return "\n".join(lines)
 
 
-def build_summary_prompt(full_text: str, max_bullets: int, template_path: Optional[str]) -> str:
+def reduce_summaries(
+	partials: List[str],
+	build_prompt: Callable[[List[str]], str],
+	summarize: Callable[[str], str],
+	fan_in: int,
+	max_tokens: int = 0,
+	concurrency: int = 0,
+	model: str = "",
+) -> str:
+	"""部分要約を fan_in 件ずつ統合する処理を1件になるまで繰り返す（各段は並列実行）"""
+	level = list(partials)
+	while len(level) > 1:
+		groups = group_for_merge(level, fan_in, max_tokens, model)
+		workers = concurrency if concurrency > 0 else min(8, len(groups))
+		with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+			# 1件だけのグループは統合せず次の段へそのまま渡す
+			futures = [executor.submit(summarize, build_prompt(group)) if len(group) > 1 else None for group in groups]
+			level = [future.result() if future else group[0] for group, future in zip(groups, futures)]
+	return level[0]
+
+
+def build_summary_prompt(
+	full_text: str, max_bullets: int, template_path: Optional[str], max_tokens: int = 0, model: str = ""
+) -> str:
+	if max_tokens > 0:
+		return render_within_budget(lambda body: build_summary_prompt(body, max_bullets, template_path), full_text, max_tokens, model)
 	tpl = _read_text_if_file(template_path)
 	if tpl:
 		return tpl.format_map(_SafeDict({
@@ -218,11 +672,30 @@ def build_summary_prompt(full_text: str, max_bullets: int, template_path: Option
 	)
 
 
-def generate_markdown(title: str, final_md_body: str, src_path: str) -> str:
+def markdown_header(title: str, src_path: str) -> str:
 	today = datetime.date.today().isoformat()
 	source_abs = os.path.abspath(src_path)
-	header = f"---\nsource: {source_abs}\ndate: {today}\n---\n\n# {title}\n\n"
-	return header + final_md_body.strip() + "\n"
+	return f"---\nsource: {source_abs}\ndate: {today}\n---\n\n# {title}\n\n"
+
+
+def generate_markdown(title: str, final_md_body: str, src_path: str) -> str:
+	return markdown_header(title, src_path) + final_md_body.strip() + "\n"
+
+
+class _StdoutStream:
+	"""ストリーミング出力をそのまま stdout へ書き出す（先頭の空白は generate_markdown と同様に除く）"""
+
+	def __init__(self) -> None:
+		self.started = False
+
+	def __call__(self, piece: str) -> None:
+		if not self.started:
+			piece = piece.lstrip()
+			if not piece:
+				return
+			self.started = True
+		sys.stdout.write(piece)
+		sys.stdout.flush()
 
 
 def _env_bool(name: str, default: bool) -> bool:
@@ -270,6 +743,12 @@ def main() -> None:
 		default=os.getenv("PDFSUMMARY_SUMMARY_PROMPT_FILE", ""),
 		help="単一パス用テンプレート（{text},{max_bullets}使用可）",
 	)
+	parser.add_argument(
+		"--stream",
+		action="store_true",
+		default=_env_bool("PDFSUMMARY_STREAM", False),
+		help="ollamaの出力を生成されたそばからstdoutへ書き出す（単一パスかつ--out未指定時。日本語リトライは行わない）",
+	)
 	parser.add_argument(
 		"--ensure-ja",
 		dest="ensure_ja",
@@ -289,6 +768,55 @@ def main() -> None:
 		default=int(os.getenv("PDFSUMMARY_JA_RETRIES", "1")),
 		help="日本語判定に失敗した際のリトライ回数（既定: 1）",
 	)
+	parser.add_argument(
+		"--concurrency",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_CONCURRENCY", "0")),
+		help="分割要約時のチャンク同時実行数（0: min(8, チャンク数)）",
+	)
+	parser.add_argument(
+		"--no-cache",
+		dest="use_cache",
+		action="store_false",
+		default=_env_bool("PDFSUMMARY_CACHE", True),
+		help="抽出テキスト/LLM出力のキャッシュを使わない",
+	)
+	parser.add_argument(
+		"--force-refresh",
+		action="store_true",
+		default=_env_bool("PDFSUMMARY_FORCE_REFRESH", False),
+		help="キャッシュを読まずに再実行し、結果でキャッシュを更新",
+	)
+	parser.add_argument(
+		"--context-tokens",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_CONTEXT_TOKENS", "0")),
+		help="モデルのコンテキスト長（トークン）。指定時は分割要約のチャンクをトークン数基準で決定",
+	)
+	parser.add_argument(
+		"--max-output-tokens",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_MAX_OUTPUT_TOKENS", "1024")),
+		help="1回の出力に見込むトークン数（--context-tokens指定時のチャンク長計算に使用）",
+	)
+	parser.add_argument(
+		"--output-token-limit",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_OUTPUT_TOKEN_LIMIT", "0")),
+		help="ollamaの1回の出力トークン数の上限（0は無制限。打ち切られた出力はキャッシュしない）",
+	)
+	parser.add_argument(
+		"--batch-size",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_BATCH_SIZE", "4")),
+		help="openaiモードの分割要約で1回の呼び出しにまとめるチャンク数（1で無効）",
+	)
+	parser.add_argument(
+		"--merge-fan-in",
+		type=int,
+		default=int(os.getenv("PDFSUMMARY_MERGE_FAN_IN", "4")),
+		help="分割要約で1回の統合にまとめる部分要約の最大数（段階的に統合）",
+	)
 	# 旧オプション（後方互換・未使用）
 	parser.add_argument(
 		"--max-chars",
@@ -351,34 +879,67 @@ def main() -> None:
 	)
 
 	args = parser.parse_args()
+	cache_dir = (os.getenv("PDFSUMMARY_CACHE_DIR") or default_cache_dir()) if args.use_cache else None
+	# プロンプト全体の上限（出力分を残す）。超える場合は本文の中央を削って収める
+	prompt_budget = args.context_tokens - args.max_output_tokens if args.context_tokens > 0 else 0
 
 	pdf_path = args.pdf
 	if not os.path.isfile(pdf_path):
 		print(f"ファイルが見つかりません: {pdf_path}", file=sys.stderr)
 		sys.exit(1)
 
-	text = extract_text_from_pdf(pdf_path)
+	try:
+		text = extract_text_from_pdf(pdf_path, cache_dir, args.force_refresh)
+	except Exception as e:
+		print(f"PDF抽出に失敗: {e}", file=sys.stderr)
+		sys.exit(2)
 	if not text.strip():
 		print("PDFからテキストを抽出できませんでした", file=sys.stderr)
 		sys.exit(2)
 
 	# 単一パス（既定）
 	if args.single_pass:
-		prompt = build_summary_prompt(text, args.max_bullets, args.summary_prompt_file or None)
+		title = args.title or os.path.splitext(os.path.basename(pdf_path))[0]
+		prompt = build_summary_prompt(text, args.max_bullets, args.summary_prompt_file or None, prompt_budget, args.model)
+		stream = _StdoutStream() if args.stream and not args.out else None
+		if stream is not None:
+			sys.stdout.write(markdown_header(title, pdf_path))
+			sys.stdout.flush()
 		try:
-			final_md = auto_summarize(prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
+			if stream is not None:
+				# 書き出し済みの出力は取り消せないため、日本語強制リトライは行わない
+				final_md = auto_summarize(
+					prompt,
+					args.llm,
+					args.model,
+					args.cmd or None,
+					args.system_prompt,
+					cache_dir,
+					args.force_refresh,
+					args.output_token_limit,
+					stream,
+				)
+			else:
+				final_md = summarize_ensuring_ja(
+					prompt,
+					args.llm,
+					args.model,
+					args.cmd or None,
+					args.system_prompt,
+					args.ensure_ja,
+					args.ja_retries,
+					cache_dir,
+					args.force_refresh,
+					args.output_token_limit,
+				)
 		except Exception as e:
 			print(f"要約に失敗: {e}", file=sys.stderr)
 			sys.exit(3)
-		# 日本語強制リトライ
-		if args.ensure_ja and not _is_likely_japanese(final_md):
-			for _ in range(max(args.ja_retries, 0)):
-				retry_prompt = prompt + "\n\n注意: 前回の出力は日本語ではありませんでした。出力は必ず日本語のみで、英語は使用しないでください。"
-				final_md = auto_summarize(retry_prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
-				if _is_likely_japanese(final_md):
-					break
+		if stream is not None:
+			# ストリーミングしなかった場合（キャッシュ命中、ollama以外）は全文をまとめて書き出す
+			sys.stdout.write("\n" if stream.started else final_md.strip() + "\n")
+			return
 
-		title = args.title or os.path.splitext(os.path.basename(pdf_path))[0]
 		rendered = generate_markdown(title, final_md, pdf_path)
 		if args.out:
 			out_path = args.out
@@ -390,41 +951,106 @@ def main() -> None:
 		return
 
 	# 旧: 分割→統合（将来削除予定）
-	chunks = chunk_text(text, max_chars=args.max_chars)
+	chunk_tokens = 0
+	if args.context_tokens > 0:
+		# コンテキスト長から固定のプロンプト部分と出力分を差し引いた残りをチャンクに割り当てる
+		prompt_overhead = count_fixed_tokens(
+			build_chunk_prompt("", args.chunk_max_bullets, args.chunk_prompt_file or None), args.model
+		)
+		chunk_tokens = args.context_tokens - prompt_overhead - args.max_output_tokens
+		if chunk_tokens <= 0:
+			print(
+				f"--context-tokens が小さすぎます（プロンプト{prompt_overhead} + 出力{args.max_output_tokens}トークン）",
+				file=sys.stderr,
+			)
+			sys.exit(1)
+	chunks = chunk_text(text, max_chars=args.max_chars, max_tokens=chunk_tokens, model=args.model)
+	# openaiでは複数チャンクを1回の呼び出しにまとめ、共通の指示文を使い回す
+	# （テンプレート指定時はその形式を優先し、まとめない）
+	if args.llm == "openai" and args.batch_size > 1 and not args.chunk_prompt_file:
+		max_prompt_tokens = int(args.context_tokens * 0.7) if args.context_tokens > 0 else 0
+		batches = group_chunks_for_batch(chunks, args.chunk_max_bullets, args.batch_size, max_prompt_tokens, args.model)
+	else:
+		batches = [[c] for c in chunks]
+	# チャンク要約は互いに独立なので並列実行し、結果は元の順序で回収する
+	concurrency = args.concurrency if args.concurrency > 0 else min(8, len(batches))
 	partials: List[str] = []
-	for idx, c in enumerate(chunks, start=1):
-		prompt = build_chunk_prompt(c, args.chunk_max_bullets, args.chunk_prompt_file or None)
-		try:
-			md = auto_summarize(prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
-		except Exception as e:
-			print(f"部分要約に失敗 (chunk {idx}/{len(chunks)}): {e}", file=sys.stderr)
-			sys.exit(4)
-		if args.ensure_ja and not _is_likely_japanese(md):
-			for _ in range(max(args.ja_retries, 0)):
-				retry_prompt = prompt + "\n\n注意: 前回の出力は日本語ではありませんでした。出力は必ず日本語のみで、英語は使用しないでください。"
-				md = auto_summarize(retry_prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
-				if _is_likely_japanese(md):
-					break
-		partials.append(md)
-
-	final_prompt = build_merge_prompt(
-		partials_md=partials,
+	with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+		futures = [
+			executor.submit(
+				summarize_chunk_batch,
+				batch,
+				args.chunk_max_bullets,
+				args.model,
+				args.system_prompt,
+				args.ensure_ja,
+				args.ja_retries,
+				cache_dir,
+				args.force_refresh,
+			)
+			if len(batch) > 1
+			else executor.submit(
+				summarize_ensuring_ja,
+				# チャンクが1つなら統合を省くため、最終形式（単一パス用）のプロンプトで要約する
+				build_summary_prompt(batch[0], args.merge_max_bullets, args.summary_prompt_file or None, prompt_budget, args.model)
+				if len(chunks) == 1
+				else build_chunk_prompt(batch[0], args.chunk_max_bullets, args.chunk_prompt_file or None, prompt_budget, args.model),
+				args.llm,
+				args.model,
+				args.cmd or None,
+				args.system_prompt,
+				args.ensure_ja,
+				args.ja_retries,
+				cache_dir,
+				args.force_refresh,
+				args.output_token_limit,
+			)
+			for batch in batches
+		]
+		for batch, future in zip(batches, futures):
+			idx = len(partials) + 1
+			try:
+				result = future.result()
+			except Exception as e:
+				label = f"{idx}-{idx + len(batch) - 1}" if len(batch) > 1 else f"{idx}"
+				print(f"部分要約に失敗 (chunk {label}/{len(chunks)}): {e}", file=sys.stderr)
+				executor.shutdown(wait=False, cancel_futures=True)
+				sys.exit(4)
+			partials.extend(result if isinstance(result, list) else [result])
+
+	# 部分要約が多い場合に1回のプロンプトへ詰め込まないよう、段階的に統合する
+	# （チャンクが1つなら最終形式で要約済みのため統合は行われない）
+	build_prompt = functools.partial(
+		build_merge_prompt,
 		max_bullets=args.merge_max_bullets,
 		include_actions=args.include_actions,
 		include_risks=args.include_risks,
 		template_path=args.merge_prompt_file or None,
+		max_tokens=prompt_budget,
+		model=args.model,
+	)
+	summarize = functools.partial(
+		summarize_ensuring_ja,
+		llm=args.llm,
+		model=args.model,
+		cmd=args.cmd or None,
+		system_prompt=args.system_prompt,
+		ensure_ja=args.ensure_ja,
+		ja_retries=args.ja_retries,
+		cache_dir=cache_dir,
+		refresh=args.force_refresh,
+		output_token_limit=args.output_token_limit,
 	)
+	max_merge_tokens = 0
+	if args.context_tokens > 0:
+		max_merge_tokens = int(args.context_tokens * 0.7) - count_fixed_tokens(build_prompt([]), args.model)
 	try:
-		final_md = auto_summarize(final_prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
+		final_md = reduce_summaries(
+			partials, build_prompt, summarize, args.merge_fan_in, max_merge_tokens, args.concurrency, args.model
+		)
 	except Exception as e:
 		print(f"最終要約に失敗: {e}", file=sys.stderr)
 		sys.exit(5)
-	if args.ensure_ja and not _is_likely_japanese(final_md):
-		for _ in range(max(args.ja_retries, 0)):
-			retry_prompt = final_prompt + "\n\n注意: 前回の出力は日本語ではありませんでした。出力は必ず日本語のみで、英語は使用しないでください。"
-			final_md = auto_summarize(retry_prompt, args.llm, args.model, args.cmd or None, args.system_prompt)
-			if _is_likely_japanese(final_md):
-				break
 
 	title = args.title or os.path.splitext(os.path.basename(pdf_path))[0]
 	rendered = generate_markdown(title, final_md, pdf_path)
@@ -0,0 +1,150 @@
+"""pdfsummary.py と pdfsummary/cli.py で共有する補助関数。"""
+import functools
+import os
+import re
+from typing import Any, Callable, List, Optional, Sequence
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "pdfsummary")
+
+
+def cache_read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def cache_write(path: str, content: str) -> None:
+    """一時ファイルに書いてからrenameし、途中状態のキャッシュを残さない。"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        # キャッシュ書き込み失敗は要約処理自体には影響させない
+        pass
+
+
+# tiktoken 使用時、1トークンあたりの文字数の上限目安（切り出し候補の幅に使用）
+MAX_CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=8)
+def _get_encoder(model: str = "") -> Any:
+    """tiktokenのエンコーダ（生成にBPE表の読み込みを伴う）を使い回す。利用できなければ None。"""
+    try:
+        import tiktoken
+
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding("cl100k_base")
+    except Exception:  # noqa: BLE001
+        encoder = None
+    return encoder
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    encoder = _get_encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    # tiktoken が無い場合の概算: 非ASCII（日本語等）は1文字≈1トークン、ASCIIは4文字≈1トークン
+    ascii_len = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_len) + (ascii_len + 3) // 4
+
+
+def fit_prefix_to_tokens(text: str, max_tokens: int, model: str = "") -> str:
+    """max_tokens に収まる最長の先頭部分を返す（最低1文字）。"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    lo, hi = 1, len(text) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid], model) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def fit_suffix_to_tokens(text: str, max_tokens: int, model: str = "") -> str:
+    """max_tokens に収まる最長の末尾部分を返す（最低1文字）。"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    lo, hi = 1, len(text) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[-mid:], model) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[-lo:]
+
+
+_OMISSION_MARK = "\n…（中略）…\n"
+
+
+def fit_to_budget(text: str, max_tokens: int, model: str = "") -> str:
+    """text を max_tokens 以内に収める。
+    まず空白・記号の連続を詰め、それでも超える場合は中央を削って先頭と末尾を残す
+    （長い入力では先頭と末尾の情報が最も参照されやすいため）。
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    text = re.sub(r"[ \t\u3000]+", " ", text)
+    text = re.sub(r"\n\s*\n\s*\n+", "\n\n", text)
+    text = re.sub(r"([^\w\s])\1{2,}", r"\1", text)
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    budget = max(max_tokens - count_tokens(_OMISSION_MARK, model), 2)
+    # 二分探索は本文全体ではなく、予算に収まり得る幅の先頭・末尾だけを対象にする
+    head_tokens = budget // 2
+    head = fit_prefix_to_tokens(text[: head_tokens * MAX_CHARS_PER_TOKEN], head_tokens, model)
+    rest = text[len(head) :]
+    tail_tokens = budget - count_tokens(head, model)
+    tail = fit_suffix_to_tokens(rest[-tail_tokens * MAX_CHARS_PER_TOKEN :], tail_tokens, model)
+    return head + _OMISSION_MARK + tail
+
+
+@functools.lru_cache(maxsize=64)
+def count_fixed_tokens(text: str, model: str = "") -> int:
+    """プロンプトの固定部分のトークン数。同じ指示文は実行中に一度だけエンコードする。"""
+    return count_tokens(text, model)
+
+
+def render_within_budget(render: Callable[[str], str], text: str, max_tokens: int, model: str = "") -> str:
+    """render(text) が max_tokens（>0 の場合）に収まるよう、可変部分の text だけを削る。"""
+    if max_tokens <= 0:
+        return render(text)
+    overhead = count_fixed_tokens(render(""), model)
+    return render(fit_to_budget(text, max(max_tokens - overhead, 1), model))
+
+
+def group_for_merge(partials: Sequence[str], fan_in: int, max_tokens: int = 0, model: str = "") -> List[List[str]]:
+    """統合1回分のグループに分ける。各グループは最大 fan_in 件、max_tokens > 0 ならその範囲内。
+    ただし段階ごとに件数が必ず減るよう、1件だけのグループで予算を超える場合も2件目までは入れる。
+    """
+    fan_in = max(fan_in, 2)
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for md in partials:
+        md_tokens = count_tokens(md, model) if max_tokens > 0 else 0
+        if current and (
+            len(current) >= fan_in
+            or (len(current) >= 2 and max_tokens > 0 and current_tokens + md_tokens > max_tokens)
+        ):
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(md)
+        current_tokens += md_tokens
+    if current:
+        groups.append(current)
+    return groups